@@ -0,0 +1,86 @@
+from prga import *
+from itertools import product
+
+import sys
+
+# default design point; tools/dse.py overrides any of these through ``BUILD_PARAMS``
+params = dict(
+        N = 2,                      # slices per CLB
+        K = 4,                      # LUT size
+        W = 8, H = 8,               # array size, including the IO ring
+        L1 = 20,                    # number of length-1 segments (per direction)
+        fc_in = 0.4, fc_out = 0.25, # connection box populations
+        pattern = "cycle_free",     # switch box pattern
+        )
+params.update(globals().get("BUILD_PARAMS", {}))
+
+# reuse the context with the builtin primitives pre-loaded by ``tools/buildserver.py --warm-context``, if any
+ctx = globals().get("WARM_CONTEXT") or Context()
+gbl_clk = ctx.create_global("clk", is_clock = True)
+gbl_clk.bind((0, 1), 0)
+ctx.create_segment('L1', params["L1"], 1)
+
+builder = ctx.build_slice("slice")
+clk = builder.create_clock("clk")
+i = builder.create_input("i", params["K"])
+o = builder.create_output("o", 1)
+lut = builder.instantiate(ctx.primitives["lut{}".format(params["K"])], "lut")
+ff = builder.instantiate(ctx.primitives["flipflop"], "ff")
+builder.connect(clk, ff.pins['clk'])
+builder.connect(i, lut.pins['in'])
+builder.connect(lut.pins['out'], o)
+builder.connect(lut.pins['out'], ff.pins['D'], vpr_pack_patterns = ('lut_dff', ))
+builder.connect(ff.pins['Q'], o)
+cluster = builder.commit()
+
+builder = ctx.build_io_block("iob")
+o = builder.create_input("outpad", 1)
+i = builder.create_output("inpad", 1)
+builder.connect(builder.instances['io'].pins['inpad'], i)
+builder.connect(o, builder.instances['io'].pins['outpad'])
+iob = builder.commit()
+
+builder = ctx.build_logic_block("clb")
+clk = builder.create_global(gbl_clk, Orientation.south)
+for i, inst in enumerate(builder.instantiate(cluster, "cluster", params["N"])):
+    builder.connect(clk, inst.pins['clk'])
+    builder.connect(builder.create_input("i{}".format(i), params["K"], Orientation.west), inst.pins['i'])
+    builder.connect(inst.pins['o'], builder.create_output("o{}".format(i), 1, Orientation.east))
+clb = builder.commit()
+
+clbtile = ctx.build_tile(clb).fill( (params["fc_in"], params["fc_out"]) ).auto_connect().commit()
+
+iotiles = {}
+for ori in Orientation:
+    builder = ctx.build_tile(iob, 4, name = "t_io_{}".format(ori.name[0]),
+            edge = OrientationTuple(False, **{ori.name: True}))
+    iotiles[ori] = builder.fill( (1., 1.) ).auto_connect().commit()
+
+builder = ctx.build_array('top', params["W"], params["H"], set_as_top = True)
+for x, y in product(range(builder.width), range(builder.height)):
+    if x in (0, builder.width - 1) and y in (0, builder.height - 1):
+        pass
+    elif x == 0:
+        builder.instantiate(iotiles[Orientation.west], (x, y))
+    elif x == builder.width - 1:
+        builder.instantiate(iotiles[Orientation.east], (x, y))
+    elif y == 0:
+        builder.instantiate(iotiles[Orientation.south], (x, y))
+    elif y == builder.height - 1:
+        builder.instantiate(iotiles[Orientation.north], (x, y))
+    else:
+        builder.instantiate(clbtile, (x, y))
+top = builder.fill( getattr(SwitchBoxPattern, params["pattern"]) ).auto_connect().commit()
+
+Flow(
+        VPRArchGeneration('vpr/arch.xml'),
+        VPR_RRG_Generation('vpr/rrg.xml'),
+        YosysScriptsCollection('syn'),
+        Materialization('magic'),
+        Translation(),
+        SwitchPathAnnotation(),
+        ProgCircuitryInsertion(),
+        VerilogCollection('rtl'),
+        ).run(ctx)
+
+ctx.pickle("ctx.pkl" if len(sys.argv) < 2 else sys.argv[1])
@@ -0,0 +1,191 @@
+# -*- encoding: ascii -*-
+"""Benchmark the RTL-to-bitstream flow of the example applications.
+
+Usage::
+
+    python tools/bench_app.py [-o bench/app] [-a APP ...] [-k REGEX] [-j JOBS] [--comp ivl|vcs]
+
+For every ``examples/app/<app>/<fabric>`` project whose fabric has been built (``ctx.pkl`` exists), the project is
+generated from scratch with ``prga.tools.wizard`` in ``<output>/<app>_<fabric>/``, using a copy of its configuration
+with absolute paths. Then each stage of the generated ``app/Makefile`` is run in order: ``syn``, ``pack``,
+``ioplan``, ``place``, ``route``, ``fasm`` and ``bitgen``. The wall time and peak RSS of each stage are recorded, and
+the channel width and critical-path delay are read from the VPR output. Projects run concurrently (``-j``); the
+stages of one project always run in order. Nothing under ``examples/`` is modified.
+
+Results are written to ``<output>/results.json``, and the generated project and the log of each stage to
+``<output>/<app>_<fabric>/``.
+"""
+
+import argparse
+import os
+import re
+import shutil
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from glob import glob
+
+import yaml
+
+from benchutil import PRGA_ROOT, run_measured, absolutize, format_table, dump_json
+
+APPS = ("bcd2bin", "picorv32", "picosoc", "romtest")
+STAGES = ("syn", "pack", "ioplan", "place", "route", "fasm", "bitgen")
+
+_reo_channel_width = re.compile(r"Circuit successfully routed with a channel width factor of (\d+)")
+_reo_critical_path = re.compile(r"Final critical path(?: delay)?(?: \(least slack\))?: ([-+.\deE]+) ns")
+
+
+def parse_vpr_log(log):
+    """Read the channel width and the critical-path delay (ns) from a VPR log. Missing values are ``None``."""
+    channel_width, critical_path = None, None
+    if os.path.isfile(log):
+        with open(log, errors = "replace") as f:
+            for line in f:
+                if (m := _reo_channel_width.search(line)):
+                    channel_width = int(m.group(1))
+                elif (m := _reo_critical_path.search(line)):
+                    critical_path = float(m.group(1))
+    return channel_width, critical_path
+
+
+class AppProject(object):
+    """An example application project, i.e. an application mapped onto one fabric.
+
+    Args:
+        directory (:obj:`str`): ``examples/app/<app>/<fabric>``
+        comp (:obj:`str`): Simulator, selects ``config/config.<comp>.yaml``
+    """
+
+    __slots__ = ["directory", "comp", "app", "fabric"]
+
+    def __init__(self, directory, comp):
+        self.directory = directory
+        self.comp = comp
+        self.app, self.fabric = directory.split(os.sep)[-2:]
+
+    @property
+    def name(self):
+        return "{}_{}".format(self.app, self.fabric)
+
+    @property
+    def config(self):
+        return os.path.join(self.directory, "config", "config.{}.yaml".format(self.comp))
+
+    @property
+    def context(self):
+        """Path to the pickled context of the fabric, or ``None`` if no configuration is found."""
+        if not os.path.isfile(self.config):
+            return None
+        with open(self.config) as f:
+            context = os.path.expandvars(yaml.safe_load(f)["context"])
+        return os.path.normpath(os.path.join(os.path.dirname(self.config), context))
+
+    def check(self):
+        """Return why this project cannot run, or ``None`` if it can."""
+        if (context := self.context) is None:
+            return "no config for {}".format(self.comp)
+        elif not os.path.isfile(context):
+            return "fabric not built ({})".format(os.path.relpath(context, PRGA_ROOT))
+        return None
+
+    def run(self, outdir, stages = STAGES, timeout = None):
+        workdir = os.path.join(outdir, self.name)
+        os.makedirs(workdir, exist_ok = True)
+        result = {"name": self.name, "app": self.app, "fabric": self.fabric, "stages": {}}
+        if (reason := self.check()) is not None:
+            result["status"] = "skipped: " + reason
+            return result
+
+        # the Makefiles are file-based: a project left over from a previous run would skip every stage
+        for project in ("app", "tests"):
+            shutil.rmtree(os.path.join(workdir, project), ignore_errors = True)
+        with open(self.config) as f:
+            cfg = absolutize(yaml.safe_load(f), os.path.dirname(self.config))
+        with open(os.path.join(workdir, "config.yaml"), "w") as f:
+            yaml.safe_dump(cfg, f, default_flow_style = False)
+
+        steps = [("project", [sys.executable, "-O", "-m", "prga.tools.wizard", "config.yaml"], workdir)]
+        steps.extend( (stage, ["make", stage], os.path.join(workdir, "app")) for stage in stages )
+
+        result["status"] = "ok"
+        for stage, cmd, cwd in steps:
+            log = os.path.join(workdir, stage + ".log")
+            r = run_measured(cmd, cwd, log, timeout = timeout)
+            result["stages"][stage] = {"status": r["status"], "wall": r["wall"], "peak_rss_kb": r["peak_rss_kb"]}
+            if stage == "route":
+                result["channel_width"], result["critical_path"] = parse_vpr_log(log)
+            if r["status"] != "ok":
+                result["status"] = "{} failed".format(stage)
+                break
+
+        if result.get("critical_path") is None and "place" in result["stages"]:
+            result["critical_path"] = parse_vpr_log(os.path.join(workdir, "place.log"))[1]
+        result["wall"] = sum(s["wall"] for s in result["stages"].values())
+        result["peak_rss_kb"] = max(s["peak_rss_kb"] for s in result["stages"].values())
+        return result
+
+
+def discover(apps = APPS, include = None, comp = "ivl"):
+    """List the application projects, optionally filtered by the regular expression ``include``."""
+    projects = []
+    for app in apps:
+        for makefile in sorted(glob(os.path.join(PRGA_ROOT, "examples", "app", app, "*", "Makefile"))):
+            project = AppProject(os.path.dirname(makefile), comp)
+            if include is None or re.search(include, project.name):
+                projects.append(project)
+    return projects
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Benchmark the RTL-to-bitstream flow of the example applications")
+    parser.add_argument("-o", "--output", type = str, default = os.path.join(PRGA_ROOT, "bench", "app"),
+            help = "Directory for the logs and results.json (default: bench/app)")
+    parser.add_argument("-a", "--apps", type = str, nargs = "+", default = list(APPS),
+            help = "Applications to run (default: {})".format(" ".join(APPS)))
+    parser.add_argument("-k", "--filter", type = str, default = None,
+            help = "Only run projects (<app>_<fabric>) matching this regular expression")
+    parser.add_argument("-l", "--list", action = "store_true", help = "List the projects and exit")
+    parser.add_argument("-j", "--jobs", type = int, default = os.cpu_count(),
+            help = "Number of projects run concurrently (default: number of CPUs)")
+    parser.add_argument("--comp", type = str, default = "ivl", choices = ["ivl", "vcs"],
+            help = "Simulator configuration used to generate the projects (default: ivl)")
+    parser.add_argument("--stages", type = str, nargs = "+", default = list(STAGES), choices = STAGES,
+            help = "Stages to run, in order (default: all)")
+    parser.add_argument("--timeout", type = float, default = None, help = "Timeout of each stage, in seconds")
+    args = parser.parse_args(argv)
+
+    projects = discover(args.apps, args.filter, args.comp)
+    if args.list:
+        for p in projects:
+            print("{:<60s} {}".format(p.name, p.check() or "ready"))
+        return 0
+
+    os.makedirs(args.output, exist_ok = True)
+    with ThreadPoolExecutor(max_workers = max(1, args.jobs)) as pool:
+        results = list(pool.map(lambda p: p.run(args.output, args.stages, args.timeout), projects))
+
+    dump_json({
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "comp": args.comp,
+        "jobs": args.jobs,
+        "results": {r["name"]: r for r in results},
+        }, os.path.join(args.output, "results.json"))
+
+    rows = []
+    for r in results:
+        row = {"name": r["name"], "status": r["status"], "wall": r.get("wall"),
+                "rss": r["peak_rss_kb"] / 1024 if "peak_rss_kb" in r else None,
+                "cw": r.get("channel_width"), "cpd": r.get("critical_path")}
+        row.update( (stage, s["wall"]) for stage, s in r["stages"].items() )
+        rows.append(row)
+    print(format_table(rows, [("name", "project", "s"), ("status", "status", "s")] +
+        [(stage, stage + " (s)", ".1f") for stage in ["project"] + args.stages] +
+        [("wall", "total (s)", ".1f"), ("rss", "peak RSS (MiB)", ".0f"), ("cw", "chan width", "d"),
+            ("cpd", "CPD (ns)", ".3f")]))
+
+    return 1 if any(r["status"] not in ("ok", ) and not r["status"].startswith("skipped") for r in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
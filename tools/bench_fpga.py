@@ -0,0 +1,201 @@
+# -*- encoding: ascii -*-
+"""Benchmark the FPGA generation flow on the example fabrics.
+
+Usage::
+
+    python tools/bench_fpga.py [-o bench/fpga] [-k REGEX] [--no-scaled] [--baseline baseline.json] [--save-baseline]
+
+Every ``examples/fpga/<prog>/<fabric>/build.py`` is copied into its own work directory and executed through
+``tools/profile_build.py``, so the results include per-pass timing as well as the total wall time, peak RSS and the
+sizes of the generated outputs (``vpr/rrg.xml``, ``vpr/arch.xml``, ``rtl/``, ``syn/`` and ``ctx.pkl``). In addition,
+synthetic scaled-up variants of ``magic/k4_N2_8x8`` (16x16, 32x32 and 64x64 by default) expose super-linear
+scaling.
+
+Only generation is benchmarked, so neither VPR nor Yosys is needed. Results are written to ``<output>/results.json``
+and compared against a stored baseline if one is given: the script exits with status 1 if any metric regressed by
+more than the tolerance.
+"""
+
+import argparse
+import os
+import re
+import shutil
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from glob import glob
+
+from benchutil import PRGA_ROOT, TOOLS_DIR, run_measured, path_size, format_table, compare_metrics, load_json, \
+        dump_json
+
+# Outputs whose sizes are recorded, relative to the build directory
+OUTPUTS = ("vpr/rrg.xml", "vpr/arch.xml", "rtl", "syn", "ctx.pkl")
+
+# Scaled-up variants: the source example and the pattern matching the size of its top-level array
+SCALED_SOURCE = "magic/k4_N2_8x8"
+SCALED_PATTERN = re.compile(r"ctx\.build_array\('top', 8, 8,")
+
+# Absolute increases that are never reported as regressions
+FLOORS = {"wall": 0.5, "cpu": 0.5, "peak_rss_kb": 16 * 1024, "bytes": 4096}
+
+
+class Benchmark(object):
+    """A fabric to be built.
+
+    Args:
+        name (:obj:`str`): Name of the benchmark
+        source (:obj:`str`): The example directory containing ``build.py``
+        size (:obj:`int`): If set, the top-level array is resized to ``size`` x ``size``
+    """
+
+    __slots__ = ["name", "source", "size"]
+
+    def __init__(self, name, source, size = None):
+        self.name = name
+        self.source = source
+        self.size = size
+
+    def prepare(self, workdir):
+        """Copy the example into ``workdir``, resizing the top-level array if needed."""
+        if os.path.exists(workdir):
+            shutil.rmtree(workdir)
+        shutil.copytree(self.source, workdir, ignore = shutil.ignore_patterns(
+            "rtl", "syn", "vpr", "*.pkl", "*.log", "build.prof*", "backup-*"))
+        if self.size is not None:
+            script = os.path.join(workdir, "build.py")
+            with open(script) as f:
+                text = f.read()
+            text, n = SCALED_PATTERN.subn("ctx.build_array('top', {0}, {0},".format(self.size), text)
+            if n != 1:
+                raise RuntimeError("Cannot resize the top-level array of {}".format(self.source))
+            with open(script, "w") as f:
+                f.write(text)
+
+    def run(self, outdir, timeout = None):
+        workdir = os.path.join(outdir, self.name)
+        self.prepare(workdir)
+        result = run_measured([sys.executable, "-O", os.path.join(TOOLS_DIR, "profile_build.py"),
+            "-o", "build.prof.json", "build.py", "ctx.pkl"], workdir, os.path.join(workdir, "build.log"),
+            timeout = timeout)
+        result["name"] = self.name
+        result["source"] = os.path.relpath(self.source, PRGA_ROOT)
+        result["size"] = self.size
+
+        prof = os.path.join(workdir, "build.prof.json")
+        if os.path.isfile(prof):
+            profile = load_json(prof)
+            result["import"] = profile["total"]["import"]
+            result["cpu"] = profile["total"]["cpu"]
+            result["passes"] = [{k: r.get(k) for k in ("key", "wall", "cpu", "peak_rss_delta_kb",
+                "modules_created", "modules_modified", "files_rendered")} for r in profile["passes"]]
+
+        result["outputs"] = {}
+        for output in OUTPUTS:
+            size = path_size(os.path.join(workdir, output))
+            if size is not None:
+                result["outputs"][output] = {"bytes": size[0], "files": size[1]}
+        return result
+
+
+def discover(include = None, scaled = True, sizes = (16, 32, 64)):
+    """List the benchmarks, optionally filtered by the regular expression ``include``."""
+    benchmarks = []
+    for script in sorted(glob(os.path.join(PRGA_ROOT, "examples", "fpga", "*", "*", "build.py"))):
+        source = os.path.dirname(script)
+        prog, fabric = source.split(os.sep)[-2:]
+        benchmarks.append(Benchmark("{}_{}".format(prog, fabric), source))
+    if scaled:
+        source = os.path.join(PRGA_ROOT, "examples", "fpga", SCALED_SOURCE)
+        for size in sizes:
+            benchmarks.append(Benchmark("{}_{}x{}".format(SCALED_SOURCE.replace("/", "_").rsplit("_", 1)[0],
+                size, size), source, size))
+    if include:
+        benchmarks = [b for b in benchmarks if re.search(include, b.name)]
+    return benchmarks
+
+
+def flatten(result):
+    """Flatten one benchmark result into ``{metric: value}`` for baseline comparison."""
+    metrics = {"total.wall": result["wall"], "total.cpu": result.get("cpu"),
+            "total.peak_rss_kb": result["peak_rss_kb"]}
+    for i, p in enumerate(result.get("passes", [])):
+        metrics["pass.{}.{}.wall".format(i, p["key"])] = p["wall"]
+    for output, size in result["outputs"].items():
+        metrics["output.{}.bytes".format(output)] = size["bytes"]
+    return metrics
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Benchmark the FPGA generation flow on the example fabrics")
+    parser.add_argument("-o", "--output", type = str, default = os.path.join(PRGA_ROOT, "bench", "fpga"),
+            help = "Directory for the builds and results.json (default: bench/fpga)")
+    parser.add_argument("-k", "--filter", type = str, default = None,
+            help = "Only run benchmarks whose names match this regular expression")
+    parser.add_argument("-l", "--list", action = "store_true", help = "List the benchmarks and exit")
+    parser.add_argument("-j", "--jobs", type = int, default = 1,
+            help = "Number of fabrics built concurrently. Timing is only comparable with the same job count")
+    parser.add_argument("--sizes", type = int, nargs = "+", default = [16, 32, 64],
+            help = "Sizes of the scaled-up variants of {}".format(SCALED_SOURCE))
+    parser.add_argument("--no-scaled", action = "store_true", help = "Skip the scaled-up variants")
+    parser.add_argument("--timeout", type = float, default = None, help = "Timeout of each build, in seconds")
+    parser.add_argument("--baseline", type = str, default = None, help = "Compare against this baseline")
+    parser.add_argument("--save-baseline", type = str, default = None,
+            help = "Store the results as a baseline into this file")
+    parser.add_argument("--tolerance", type = float, default = 0.2,
+            help = "Relative increase tolerated before a metric is reported as a regression (default: 0.2)")
+    args = parser.parse_args(argv)
+
+    benchmarks = discover(args.filter, not args.no_scaled, args.sizes)
+    if args.list:
+        for b in benchmarks:
+            print(b.name)
+        return 0
+
+    os.makedirs(args.output, exist_ok = True)
+    with ThreadPoolExecutor(max_workers = args.jobs) as pool:
+        results = list(pool.map(lambda b: b.run(args.output, args.timeout), benchmarks))
+
+    report = {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": sys.version.split()[0],
+            "jobs": args.jobs,
+            "results": {r["name"]: r for r in results},
+            }
+    dump_json(report, os.path.join(args.output, "results.json"))
+    if args.save_baseline:
+        dump_json(report, args.save_baseline)
+
+    rows = []
+    for r in results:
+        row = {"name": r["name"], "status": r["status"], "wall": r["wall"], "rss": r["peak_rss_kb"] / 1024}
+        for output, key in (("vpr/rrg.xml", "rrg"), ("vpr/arch.xml", "arch"), ("rtl", "rtl"), ("ctx.pkl", "ctx")):
+            if output in r["outputs"]:
+                row[key] = r["outputs"][output]["bytes"] / (1 << 20)
+        rows.append(row)
+    print(format_table(rows, [("name", "benchmark", "s"), ("status", "status", "s"), ("wall", "wall (s)", ".2f"),
+        ("rss", "peak RSS (MiB)", ".1f"), ("rrg", "rrg.xml (MiB)", ".2f"), ("arch", "arch.xml (MiB)", ".3f"),
+        ("rtl", "rtl/ (MiB)", ".2f"), ("ctx", "ctx.pkl (MiB)", ".2f")]))
+
+    failed = [r["name"] for r in results if r["status"] != "ok"]
+    if failed:
+        print("\nFailed builds (see <output>/<benchmark>/build.log): {}".format(", ".join(failed)))
+
+    regressed = False
+    if args.baseline:
+        baseline = load_json(args.baseline)["results"]
+        for r in results:
+            if r["name"] not in baseline or r["status"] != "ok":
+                continue
+            regressions = compare_metrics(flatten(r), flatten(baseline[r["name"]]), args.tolerance, FLOORS)
+            for metric, old, new in regressions:
+                regressed = True
+                print("[REGRESSION] {}: {} {:.3f} -> {:.3f} (+{:.1%})".format(
+                    r["name"], metric, old, new, (new - old) / old if old else float("inf")))
+        if not regressed:
+            print("\nNo regression against {}".format(args.baseline))
+
+    return 1 if failed or regressed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
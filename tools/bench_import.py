@@ -0,0 +1,97 @@
+# -*- encoding: ascii -*-
+"""Benchmark the import time of the PRGA entry points.
+
+Usage::
+
+    python tools/bench_import.py [-n REPEAT] [--top N] [--target MODULE=SECONDS ...] [MODULE ...]
+
+Each module is imported in a fresh interpreter (``python -X importtime -c "import MODULE"``) ``REPEAT`` times, and the
+fastest run is reported together with the submodules that contribute the most to it. The script exits with status 1
+if any module exceeds its target. By default the ``prga`` package and the ``bitgen`` and ``wizard`` entry points
+are measured, which are invoked many times by the generated Makefiles.
+"""
+
+import argparse
+import re
+import subprocess
+import sys
+import time
+
+from benchutil import format_table, dump_json
+
+MODULES = ("prga", "prga.tools.bitgen", "prga.tools.wizard")
+
+# import-time targets in seconds for the entry points invoked by the generated Makefiles
+TARGETS = {"prga.tools.bitgen": 0.5, "prga.tools.wizard": 0.5}
+
+_reo_importtime = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)\s*$")
+
+
+def measure(module, repeat = 5):
+    """Import ``module`` ``repeat`` times in fresh interpreters.
+
+    Returns:
+        :obj:`tuple` [:obj:`float`, :obj:`dict` [:obj:`str`, :obj:`tuple` [:obj:`float`, :obj:`float` ]]]: Wall time
+            of the fastest run, and the (self, cumulative) import time in seconds of each module in that run
+    """
+    best, best_modules = None, None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        p = subprocess.run([sys.executable, "-X", "importtime", "-c", "import " + module],
+                stdout = subprocess.DEVNULL, stderr = subprocess.PIPE, universal_newlines = True)
+        wall = time.perf_counter() - start
+        if p.returncode != 0:
+            raise RuntimeError("Failed to import {}:\n{}".format(module, p.stderr))
+        if best is None or wall < best:
+            best, best_modules = wall, {}
+            for line in p.stderr.splitlines():
+                if (m := _reo_importtime.match(line)):
+                    best_modules[m.group(4)] = int(m.group(1)) / 1e6, int(m.group(2)) / 1e6
+    return best, best_modules
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Benchmark the import time of the PRGA entry points")
+    parser.add_argument("modules", type = str, nargs = "*", default = list(MODULES),
+            help = "Modules to import (default: {})".format(" ".join(MODULES)))
+    parser.add_argument("-n", "--repeat", type = int, default = 5, help = "Runs per module; the fastest is kept")
+    parser.add_argument("--top", type = int, default = 10,
+            help = "Number of slowest PRGA submodules (by self time) listed per module")
+    parser.add_argument("--target", type = str, nargs = "+", default = [],
+            help = "MODULE=SECONDS import-time targets (default: {})".format(
+                " ".join("{}={}".format(k, v) for k, v in TARGETS.items())))
+    parser.add_argument("-o", "--output", type = str, default = None, help = "Write the results as JSON")
+    args = parser.parse_args(argv)
+
+    targets = dict(TARGETS)
+    for spec in args.target:
+        module, _, seconds = spec.partition("=")
+        targets[module] = float(seconds)
+
+    results, rows = {}, []
+    for module in args.modules:
+        wall, modules = measure(module, args.repeat)
+        results[module] = {"wall": wall, "target": targets.get(module), "modules": modules}
+        target = targets.get(module)
+        rows.append({"module": module, "wall": wall, "cumulative": modules.get(module, (None, None))[1],
+            "target": target, "status": "-" if target is None else ("ok" if wall <= target else "SLOW")})
+
+    print(format_table(rows, [("module", "module", "s"), ("wall", "interpreter + import (s)", ".3f"),
+        ("cumulative", "import (s)", ".3f"), ("target", "target (s)", ".2f"), ("status", "status", "s")]))
+
+    for module, r in results.items():
+        slowest = sorted(((k, v) for k, v in r["modules"].items() if k.startswith("prga")),
+                key = lambda kv: kv[1][0], reverse = True)[:args.top]
+        if slowest:
+            print("\nSlowest submodules imported by {} (self time):".format(module))
+            print(format_table([{"name": k, "self": v[0], "cumulative": v[1]} for k, v in slowest],
+                [("name", "module", "s"), ("self", "self (s)", ".4f"), ("cumulative", "cumulative (s)", ".4f")]))
+
+    if args.output:
+        dump_json(results, args.output)
+
+    return 1 if any(row["status"] == "SLOW" for row in rows) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,203 @@
+# -*- encoding: ascii -*-
+"""Helpers shared by the benchmark and regression scripts under ``tools/``."""
+
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+
+PRGA_ROOT = os.environ.get("PRGA_ROOT") or os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+TOOLS_DIR = os.path.join(PRGA_ROOT, "tools")
+
+# example configurations and Makefiles refer to ``${PRGA_ROOT}``, normally exported by ``envscr/activate``
+os.environ.setdefault("PRGA_ROOT", PRGA_ROOT)
+
+
+# Runs a command and reports its exit status, wall time and peak RSS through the file descriptor ``argv[1]``.
+#
+# On Linux, the peak RSS a parent reads from ``wait4`` starts at the high-water mark the child inherited when it was
+# forked (or ``vfork``-ed by ``subprocess``) from the parent, and ``exec`` does not reset it. Commands are therefore
+# started from this small, freshly ``exec``-ed interpreter instead of the benchmark script, whose own memory would
+# otherwise be reported as the floor of every command.
+_MEASURE_HELPER = """
+import os, sys, time
+fd = int(sys.argv[1])
+start = time.perf_counter()
+pid = os.fork()
+if pid == 0:
+    try:
+        os.close(fd)
+        os.execvp(sys.argv[2], sys.argv[2:])
+    except OSError as e:
+        os.write(2, "{}: {}\\n".format(sys.argv[2], e).encode())
+    os._exit(127)
+_, status, rusage = os.wait4(pid, 0)
+os.write(fd, "{} {} {}".format(status, time.perf_counter() - start, rusage.ru_maxrss).encode())
+"""
+
+
+def run_measured(cmd, cwd, log = None, env = None, timeout = None):
+    """Run ``cmd`` and measure its wall time and peak RSS.
+
+    The peak RSS is read from ``wait4``, so it covers the command and every descendant it waited for (e.g. ``vpr``
+    launched by ``make``). The command is started from a minimal helper interpreter, so the value does not include the
+    memory of the calling script; it is still an upper bound, never below the few MiB of the helper itself.
+
+    Args:
+        cmd (:obj:`Sequence` [:obj:`str` ]): The command
+        cwd (:obj:`str`): Working directory
+        log (:obj:`str`): If set, stdout and stderr are redirected into this file
+        env (:obj:`Mapping`): Environment variables
+        timeout (:obj:`float`): Kill the command (and its process group) after this many seconds
+
+    Returns:
+        :obj:`dict`: ``returncode``, ``status`` (``ok``, ``fail`` or ``timeout``), ``wall`` (s) and
+            ``peak_rss_kb``
+    """
+    f = open(log, "w") if log else subprocess.DEVNULL
+    rfd, wfd = os.pipe()
+    try:
+        start = time.perf_counter()
+        p = subprocess.Popen([sys.executable, "-I", "-S", "-c", _MEASURE_HELPER, str(wfd)] + list(cmd),
+                cwd = cwd, env = env, stdout = f, stderr = subprocess.STDOUT, pass_fds = (wfd, ),
+                start_new_session = True)
+        os.close(wfd)
+        wfd = None
+        timed_out = False
+        while True:
+            pid, status, rusage = os.wait4(p.pid, os.WNOHANG if timeout else 0)
+            if pid:
+                break
+            if time.perf_counter() - start > timeout:
+                timed_out = True
+                os.killpg(p.pid, signal.SIGKILL)
+                timeout = None
+            else:
+                time.sleep(0.05)
+        wall = time.perf_counter() - start
+        with os.fdopen(rfd) as pipe:
+            rfd = None
+            report = pipe.read().split()
+    finally:
+        for fd in (rfd, wfd):
+            if fd is not None:
+                os.close(fd)
+        if log:
+            f.close()
+    if report:
+        # the command's own status, time and peak RSS, measured by the helper
+        status, wall, maxrss = int(report[0]), float(report[1]), int(report[2])
+    else:
+        # the helper was killed (timeout) before reporting
+        maxrss = rusage.ru_maxrss
+    p.returncode = returncode = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -os.WTERMSIG(status)
+    if sys.platform == "darwin":
+        maxrss //= 1024
+    return {
+            "returncode": returncode,
+            "status": "timeout" if timed_out else ("ok" if returncode == 0 else "fail"),
+            "wall": wall,
+            "peak_rss_kb": maxrss,
+            }
+
+
+def snapshot_files(root):
+    """Map every regular file under ``root`` to its (mtime_ns, size)."""
+    files = {}
+    for dirpath, _, filenames in os.walk(root):
+        for f in filenames:
+            path = os.path.join(dirpath, f)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            files[path] = st.st_mtime_ns, st.st_size
+    return files
+
+
+def path_size(path):
+    """Total size in bytes and number of files of ``path`` (a file or a directory), or ``None`` if it is missing."""
+    if os.path.isfile(path):
+        return os.path.getsize(path), 1
+    elif not os.path.isdir(path):
+        return None
+    size, count = 0, 0
+    for dirpath, _, filenames in os.walk(path):
+        for f in filenames:
+            size += os.path.getsize(os.path.join(dirpath, f))
+            count += 1
+    return size, count
+
+
+def absolutize(obj, base):
+    """Recursively turn the strings of a configuration that are relative paths existing under ``base`` into absolute
+    paths, so that the configuration can be moved to another directory."""
+    if isinstance(obj, dict):
+        return {k: absolutize(v, base) for k, v in obj.items()}
+    elif isinstance(obj, list):
+        return [absolutize(v, base) for v in obj]
+    elif isinstance(obj, str) and not os.path.isabs(obj):
+        path = os.path.normpath(os.path.join(base, os.path.expandvars(obj)))
+        return path if os.path.exists(path) else obj
+    return obj
+
+
+def format_table(rows, columns):
+    """Format ``rows`` as a plain text table.
+
+    Args:
+        rows (:obj:`Sequence` [:obj:`Mapping` ]): The rows
+        columns (:obj:`Sequence` [:obj:`tuple` [:obj:`str`, :obj:`str`, :obj:`str` ]]): (key, header, format spec)
+            of each column. Missing values are printed as ``-``
+    """
+    cells = [[header for _, header, _ in columns]]
+    for row in rows:
+        line = []
+        for key, _, spec in columns:
+            v = row.get(key)
+            line.append("-" if v is None else format(v, spec))
+        cells.append(line)
+    widths = [max(len(line[i]) for line in cells) for i in range(len(columns))]
+    lines = []
+    for j, line in enumerate(cells):
+        lines.append("  ".join(c.ljust(w) if i == 0 else c.rjust(w) for i, (c, w) in enumerate(zip(line, widths))))
+        if j == 0:
+            lines.append("  ".join("-" * w for w in widths))
+    return "\n".join(lines)
+
+
+def compare_metrics(current, baseline, tolerance, floors):
+    """Compare two flat metric dicts and list the regressions.
+
+    Args:
+        current (:obj:`Mapping` [:obj:`str`, :obj:`float` ]): Current metrics
+        baseline (:obj:`Mapping` [:obj:`str`, :obj:`float` ]): Baseline metrics
+        tolerance (:obj:`float`): Relative increase allowed, e.g. 0.2 for 20%
+        floors (:obj:`Mapping` [:obj:`str`, :obj:`float` ]): Absolute increase always allowed, keyed by the metric
+            suffix (e.g. ``wall``); guards against noise in small numbers
+
+    Returns:
+        :obj:`list` [:obj:`tuple` [:obj:`str`, :obj:`float`, :obj:`float` ]]: (metric, baseline, current)
+    """
+    regressions = []
+    for key, old in baseline.items():
+        new = current.get(key)
+        if new is None or old is None:
+            continue
+        floor = floors.get(key.rsplit(".", 1)[-1], 0)
+        if new > old * (1 + tolerance) and new - old > floor:
+            regressions.append( (key, old, new) )
+    return regressions
+
+
+def load_json(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def dump_json(obj, path):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok = True)
+    with open(path, "w") as f:
+        json.dump(obj, f, indent = 4, sort_keys = True)
@@ -0,0 +1,322 @@
+# -*- encoding: ascii -*-
+"""A long-lived FPGA build server that keeps PRGA imported and forks one process per build.
+
+Usage::
+
+    python -O tools/buildserver.py serve [-s SOCKET] [-j MAX_JOBS] [--warm-context]
+    python tools/buildserver.py submit [-s SOCKET] [-p KEY=VALUE ...] build.py [args ...]
+    python tools/buildserver.py stop [-s SOCKET]
+
+``serve`` imports ``prga`` (and everything ``from prga import *`` pulls in) once, then listens on a local Unix
+socket. Each ``submit`` sends a build script together with its arguments, working directory and environment; the
+server forks, and the child runs the script as ``__main__`` with its output streamed back to the client. The exit
+status of the script becomes the exit status of ``submit``. Builds run concurrently, up to ``--max-jobs`` at a time.
+
+Parameter sets given with ``-p`` are passed to the script as the global dict ``BUILD_PARAMS``. With
+``--warm-context``, the server also creates a ``Context`` with the builtin primitives once; every child gets its own
+copy-on-write copy as the global ``WARM_CONTEXT``. Scripts opt in with::
+
+    ctx = globals().get("WARM_CONTEXT") or Context()
+
+The socket is created in ``$XDG_RUNTIME_DIR``, or else in a private (``0700``) directory under the temporary
+directory. ``submit`` only talks to a socket owned by the current user, and the server only accepts builds from
+processes of the same user, since requests carry the whole environment of the client.
+"""
+
+import argparse
+import json
+import os
+import runpy
+import selectors
+import socket
+import stat
+import struct
+import sys
+import tempfile
+import time
+import traceback
+
+_SENTINEL = b"\0PRGA-BUILDSERVER-EXIT:"
+
+# requests carry the environment of the client; anything larger is not a request
+_MAX_REQUEST = 16 << 20
+
+
+def default_socket():
+    runtime = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime and os.path.isdir(runtime):
+        return os.path.join(runtime, "prga-buildserver.sock")
+    return os.path.join(tempfile.gettempdir(), "prga-buildserver-{}".format(os.getuid()), "server.sock")
+
+
+def _check_owner(path, private = False):
+    """Return why ``path`` cannot be trusted, or ``None`` if it is owned by the current user (and, if ``private``,
+    not accessible by anyone else)."""
+    st = os.lstat(path)
+    if st.st_uid != os.getuid():
+        return "{} is owned by uid {}, not by the current user".format(path, st.st_uid)
+    elif private and st.st_mode & 0o077:
+        return "{} is accessible by other users (mode {:o})".format(path, stat.S_IMODE(st.st_mode))
+    return None
+
+
+def _peer_uid(conn):
+    """User ID of the process at the other end of the Unix socket ``conn``, or ``None`` if it cannot be read."""
+    if not hasattr(socket, "SO_PEERCRED"):
+        return None
+    _, uid, _ = struct.unpack("3i", conn.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i")))
+    return uid
+
+
+def _run_child(conn, request, init_globals):
+    """Body of a forked build process. Never returns."""
+    code = 0
+    try:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        fd = conn.fileno()
+        devnull = os.open(os.devnull, os.O_RDONLY)
+        os.dup2(devnull, 0)
+        os.dup2(fd, 1)
+        os.dup2(fd, 2)
+        # the inherited streams are block-buffered when the server does not run on a terminal; reopen them so that
+        # the output of the build reaches the client as it is printed
+        sys.stdout = open(1, "w", buffering = 1, closefd = False)
+        sys.stderr = open(2, "w", buffering = 1, closefd = False)
+        os.environ.clear()
+        os.environ.update(request["env"])
+        os.chdir(request["cwd"])
+
+        script = request["script"]
+        sys.argv = [script] + request["args"]
+        sys.path[0] = os.path.dirname(os.path.abspath(script))
+        init_globals = dict(init_globals, BUILD_PARAMS = request.get("params", {}))
+        runpy.run_path(script, init_globals = init_globals, run_name = "__main__")
+    except SystemExit as e:
+        code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+        if not isinstance(e.code, (int, type(None))):
+            print(e.code, file = sys.stderr)
+    except BaseException:
+        traceback.print_exc()
+        code = 1
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        finally:
+            os._exit(code)
+
+
+def serve(args):
+    start = time.perf_counter()
+    import prga
+    exec("from prga import *", {})
+    init_globals = {}
+    if args.warm_context:
+        init_globals["WARM_CONTEXT"] = prga.Context()
+    print("[buildserver] PRGA {} loaded in {:.2f}s".format(getattr(prga, "VERSION", "?"),
+        time.perf_counter() - start), flush = True)
+
+    directory = os.path.dirname(os.path.abspath(args.socket))
+    os.makedirs(directory, mode = 0o700, exist_ok = True)
+    if (reason := _check_owner(directory, private = True)):
+        print("[buildserver] refusing to serve: {}".format(reason), file = sys.stderr)
+        return 1
+    if os.path.lexists(args.socket):
+        if (reason := _check_owner(args.socket)):
+            print("[buildserver] refusing to serve: {}".format(reason), file = sys.stderr)
+            return 1
+        os.unlink(args.socket)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    umask = os.umask(0o077)
+    try:
+        server.bind(args.socket)
+    finally:
+        os.umask(umask)
+    server.listen(16)
+    print("[buildserver] listening on {}".format(args.socket), flush = True)
+
+    # the server socket and the connections whose request is still being received (data: the bytes received so far)
+    sel = selectors.DefaultSelector()
+    sel.register(server, selectors.EVENT_READ)
+    pending, running = [], {}     # running: pid -> (conn, script, start time)
+    stopping = False
+
+    def drop(conn):
+        sel.unregister(conn)
+        conn.close()
+
+    try:
+        while not stopping or pending or running:
+            # forks happen in this single thread only, so children never inherit a held lock. Requests are read
+            # without blocking, so that a slow or silent client never stalls the other builds
+            for key, _ in sel.select(timeout = 0.1):
+                if key.fileobj is server:
+                    conn, _ = server.accept()
+                    if (uid := _peer_uid(conn)) is not None and uid != os.getuid():
+                        print("[buildserver] rejected a connection from uid {}".format(uid), flush = True)
+                        conn.close()
+                        continue
+                    conn.setblocking(False)
+                    sel.register(conn, selectors.EVENT_READ, bytearray())
+                    continue
+
+                conn, data = key.fileobj, key.data
+                try:
+                    chunk = conn.recv(65536)
+                except BlockingIOError:
+                    continue
+                except OSError:
+                    chunk = b""
+                data += chunk
+                if not chunk or len(data) > _MAX_REQUEST:
+                    drop(conn)
+                    continue
+                elif not data.endswith(b"\n"):
+                    continue
+                sel.unregister(conn)
+                conn.setblocking(True)
+                try:
+                    request = json.loads(data.decode())
+                except ValueError as e:
+                    print("[buildserver] bad request: {}".format(e), flush = True)
+                    conn.close()
+                    continue
+                if request.get("command") == "stop":
+                    if not stopping:
+                        stopping = True
+                        sel.unregister(server)
+                    conn.sendall(_SENTINEL + b"0\n")
+                    conn.close()
+                else:
+                    pending.append( (conn, request) )
+
+            while pending and len(running) < args.max_jobs:
+                conn, request = pending.pop(0)
+                pid = os.fork()
+                if pid == 0:
+                    # drop every other client connection, or their clients would wait for this child to exit
+                    for other in ([c for c, _ in pending] + [c for c, _, _ in running.values()] +
+                            [key.fileobj for key in sel.get_map().values() if key.fileobj is not server]):
+                        other.close()
+                    sel.close()
+                    server.close()
+                    _run_child(conn, request, init_globals)
+                running[pid] = conn, request["script"], time.perf_counter()
+                print("[buildserver] [{}] started {} {}".format(pid, request["script"], " ".join(request["args"])),
+                        flush = True)
+
+            while running:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+                if pid == 0:
+                    break
+                conn, script, t = running.pop(pid)
+                code = os.WEXITSTATUS(status) if os.WIFEXITED(status) else 128 + os.WTERMSIG(status)
+                try:
+                    conn.sendall(_SENTINEL + str(code).encode() + b"\n")
+                except OSError:
+                    pass
+                conn.close()
+                print("[buildserver] [{}] finished {} with status {} in {:.2f}s".format(
+                    pid, script, code, time.perf_counter() - t), flush = True)
+    finally:
+        for key in list(sel.get_map().values()):
+            key.fileobj.close()
+        server.close()
+        if os.path.lexists(args.socket) and not _check_owner(args.socket):
+            os.unlink(args.socket)
+    return 0
+
+
+def _communicate(sock_path, request):
+    """Send ``request`` and stream the response to stdout. Returns the exit status reported by the server."""
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        # never send the environment to a server run by someone else
+        if (reason := _check_owner(sock_path)):
+            raise OSError(reason)
+        conn.connect(sock_path)
+        if (uid := _peer_uid(conn)) is not None and uid != os.getuid():
+            raise OSError("the server runs as uid {}, not as the current user".format(uid))
+    except OSError as e:
+        conn.close()
+        print("[buildserver] cannot connect to {}: {}".format(sock_path, e), file = sys.stderr)
+        return 255
+    conn.sendall(json.dumps(request).encode() + b"\n")
+
+    # the exit status sentinel starts with a NUL byte: hold back everything from the last NUL byte on, and stream
+    # the rest as it arrives
+    out, held = sys.stdout.buffer, b""
+    while (chunk := conn.recv(65536)):
+        held += chunk
+        idx = held.rfind(b"\0")
+        if idx != 0:
+            out.write(held[:idx] if idx > 0 else held)
+            out.flush()
+            held = held[idx:] if idx > 0 else b""
+    conn.close()
+
+    idx = held.rfind(_SENTINEL)
+    if idx < 0:
+        out.write(held)
+        out.flush()
+        print("[buildserver] connection closed without an exit status", file = sys.stderr)
+        return 255
+    out.write(held[:idx])
+    out.flush()
+    return int(held[idx + len(_SENTINEL):].strip())
+
+
+def submit(args):
+    params = {}
+    for spec in args.param:
+        key, _, value = spec.partition("=")
+        try:
+            params[key] = json.loads(value)
+        except ValueError:
+            params[key] = value
+    return _communicate(args.socket, {
+        "script": os.path.abspath(args.script),
+        "args": args.args,
+        "cwd": os.getcwd(),
+        "env": dict(os.environ),
+        "params": params,
+        })
+
+
+def stop(args):
+    return _communicate(args.socket, {"command": "stop"})
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Long-lived FPGA build server with PRGA preloaded")
+    subparsers = parser.add_subparsers(dest = "command")
+    subparsers.required = True
+
+    p = subparsers.add_parser("serve", help = "Start the server")
+    p.add_argument("-j", "--max-jobs", type = int, default = os.cpu_count(),
+            help = "Maximum number of concurrent builds (default: number of CPUs)")
+    p.add_argument("--warm-context", action = "store_true",
+            help = "Create a Context once and pass a copy to each build as WARM_CONTEXT")
+    p.set_defaults(func = serve)
+
+    p = subparsers.add_parser("submit", help = "Run a build script on the server")
+    p.add_argument("-p", "--param", type = str, action = "append", default = [],
+            help = "KEY=VALUE added to BUILD_PARAMS. VALUE is parsed as JSON if possible")
+    p.add_argument("script", type = str, help = "The build script, e.g. build.py")
+    p.add_argument("args", nargs = argparse.REMAINDER, help = "Arguments passed to the build script")
+    p.set_defaults(func = submit)
+
+    p = subparsers.add_parser("stop", help = "Stop the server once the queued builds finish")
+    p.set_defaults(func = stop)
+
+    for p in subparsers.choices.values():
+        p.add_argument("-s", "--socket", type = str, default = default_socket(),
+                help = "Unix socket of the server (default: {})".format(default_socket()))
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
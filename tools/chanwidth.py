@@ -0,0 +1,155 @@
+# -*- encoding: ascii -*-
+"""Find the minimum routable number of routing tracks by routing fabric variants in parallel.
+
+Usage::
+
+    python tools/chanwidth.py SPEC.yaml --param L1 --values 4 8 12 16 20 [--set KEY=VALUE ...] [-j JOBS]
+
+``SPEC.yaml`` is a design-space exploration specification (see ``tools/dse.py``); its ``build`` script, ``params``
+and ``apps`` are used, while its ``grid`` is replaced by the candidate values of ``--param``, the build parameter
+that scales the segments passed to ``create_segment``. Each candidate fabric is generated (including its RRG) and
+every application is implemented up to ``route``, all candidates concurrently. Unlike VPR's own binary search, the
+candidates do not wait for each other, and each run routes against a fixed, pre-generated RRG.
+
+Synthesis only depends on the application and the primitives of the fabric, not on the routing resources, so each
+application is synthesized once (in ``<output>/syn/<app>``, against the fabric of the first candidate) and the
+synthesized netlist is copied into the project of every candidate. Use ``--resynthesize`` when ``--param`` changes
+the primitives, e.g. the LUT size. Packing and placement do depend on the candidate fabric, and run per candidate.
+
+The minimum routable configuration is the smallest candidate on which every application routes. The runtime of
+each candidate is reported alongside, in ``<output>/results.json``.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchutil import TOOLS_DIR, run_measured, snapshot_files, format_table, dump_json
+from dse import DesignPoint, load_spec, point_name, app_name
+
+STAGES = ("syn", "pack", "ioplan", "place", "route")
+
+
+def synthesize(point, config, workdir, timeout = None):
+    """Synthesize an application once on the fabric of ``point``.
+
+    Returns:
+        :obj:`tuple` [:obj:`dict`, :obj:`tuple` ]: The result of the run, and the seed passed to
+            `DesignPoint.implement` (the generated ``app/`` and the files written by ``make syn``), or ``None`` if
+            synthesis failed
+    """
+    result = point.implement(config, [], timeout, workdir)
+    if result["status"] != "ok":
+        return result, None
+    app = os.path.join(workdir, "app")
+    before = snapshot_files(app)
+    r = run_measured(["make", "syn"], app, os.path.join(workdir, "syn.log"), timeout = timeout)
+    result["stages"]["syn"] = r["wall"]
+    if r["status"] != "ok":
+        result["status"] = "syn failed"
+        return result, None
+    return result, (app, sorted(os.path.relpath(path, app) for path, stat in snapshot_files(app).items()
+        if not path.endswith(".log") and before.get(path) != stat))
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Find the minimum routable number of routing tracks")
+    parser.add_argument("spec", type = str, help = "Exploration specification (YAML), see tools/dse.py")
+    parser.add_argument("--param", type = str, required = True,
+            help = "Build parameter controlling the number of tracks, e.g. L1")
+    parser.add_argument("--values", type = json.loads, nargs = "+", required = True,
+            help = "Candidate values of the parameter")
+    parser.add_argument("--set", type = str, nargs = "+", default = [],
+            help = "KEY=VALUE overriding the parameters of the specification. VALUE is parsed as JSON if possible")
+    parser.add_argument("-o", "--output", type = str, default = None,
+            help = "Output directory (default: bench/chanwidth/<name of the spec directory>/<param>)")
+    parser.add_argument("-j", "--jobs", type = int, default = os.cpu_count(),
+            help = "Number of candidates processed concurrently (default: number of CPUs)")
+    parser.add_argument("--server", action = "store_true",
+            help = "Submit builds to a running tools/buildserver.py instead of starting new interpreters")
+    parser.add_argument("--resynthesize", action = "store_true",
+            help = "Synthesize the applications on every candidate instead of once, e.g. when --param changes the "
+            "primitives")
+    parser.add_argument("--timeout", type = float, default = None, help = "Timeout of each step, in seconds")
+    args = parser.parse_args(argv)
+
+    spec = load_spec(args.spec)
+    spec["stages"] = list(STAGES)
+    if not spec["apps"]:
+        parser.error("The specification lists no application")
+    params = dict(spec.get("params", {}))
+    for s in args.set:
+        key, _, value = s.partition("=")
+        try:
+            params[key] = json.loads(value)
+        except ValueError:
+            params[key] = value
+
+    outdir = os.path.abspath(args.output or os.path.join(TOOLS_DIR, "..", "bench", "chanwidth",
+        os.path.basename(os.path.dirname(os.path.abspath(args.spec))), args.param))
+    # duplicate candidates would share a directory
+    values = sorted(set(args.values))
+    points = []
+    for value in values:
+        p = dict(params)
+        p[args.param] = value
+        points.append(DesignPoint(spec, p, {args.param: value}, outdir))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers = max(1, args.jobs)) as pool:
+        results = list(pool.map(lambda p: {"name": point_name(p.grid_params), "params": p.params, "apps": {},
+            "build": p.build(args.server, args.timeout)}, points))
+
+        # synthesize every application once, on the first fabric that was built
+        seeds, synthesis = {}, {}
+        built = [p for p, r in zip(points, results) if r["build"]["status"] == "ok"]
+        if built and not args.resynthesize:
+            for config, (r, seed) in zip(spec["apps"], pool.map(lambda config: synthesize(built[0], config,
+                    os.path.join(outdir, "syn", app_name(config)), args.timeout), spec["apps"])):
+                synthesis[r.pop("app")] = r
+                seeds[config] = seed
+
+        def implement(point, result):
+            if result["build"]["status"] == "ok":
+                for config in spec["apps"]:
+                    r = point.implement(config, STAGES, args.timeout, seed = seeds.get(config))
+                    result["apps"][r.pop("app")] = r
+            return result
+
+        results = list(pool.map(implement, points, results))
+
+    rows = []
+    for value, r in zip(values, results):
+        r["routable"] = r["build"]["status"] == "ok" and all(
+                a["status"] == "ok" and a.get("channel_width") is not None for a in r["apps"].values())
+        rows.append({"value": value, "build": r["build"]["status"], "build_wall": r["build"]["wall"],
+            "routable": "yes" if r["routable"] else "no",
+            "cw": max((a.get("channel_width") or 0 for a in r["apps"].values()), default = 0) or None,
+            "cpd": max((a.get("critical_path") or 0 for a in r["apps"].values()), default = 0) or None,
+            "impl_wall": sum(sum(a["stages"].values()) for a in r["apps"].values()),
+            "route_wall": sum(a["stages"].get("route", 0) for a in r["apps"].values())})
+
+    minimum = next((row["value"] for row in rows if row["routable"] == "yes"), None)
+    dump_json({"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "spec": os.path.abspath(args.spec),
+        "param": args.param, "params": params, "minimum": minimum, "wall": time.perf_counter() - start,
+        "synthesis": synthesis, "results": results}, os.path.join(outdir, "results.json"))
+
+    if synthesis:
+        print(format_table([{"app": app, "status": r["status"], "wall": sum(r["stages"].values())}
+            for app, r in synthesis.items()], [("app", "shared synthesis", "s"), ("status", "status", "s"),
+                ("wall", "time (s)", ".1f")]) + "\n")
+    print(format_table(rows, [("value", args.param, ""), ("build", "build", "s"),
+        ("build_wall", "build (s)", ".1f"), ("routable", "routable", "s"), ("cw", "chan width", "d"),
+        ("cpd", "worst CPD (ns)", ".3f"), ("route_wall", "route (s)", ".1f"), ("impl_wall", "impl (s)", ".1f")]))
+    if minimum is None:
+        print("\nNo candidate is routable for all applications")
+        return 1
+    print("\nMinimum routable {} = {} (total {:.1f}s)".format(args.param, minimum, time.perf_counter() - start))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,224 @@
+# -*- encoding: ascii -*-
+"""Design-space exploration: build a grid of fabric variants in parallel and implement applications on each.
+
+Usage::
+
+    python tools/dse.py SPEC.yaml [-o bench/dse] [-j JOBS] [--server] [--skip-apps]
+
+The specification (see ``examples/dse/k4/dse.yaml``) names a parameterized build script, a grid of parameter values
+and a list of application configurations::
+
+    build: build.py                 # reads its parameters from the global dict ``BUILD_PARAMS``
+    params: {W: 8, H: 8}            # shared by all design points
+    grid: {N: [2, 4], L1: [12, 20]} # every combination is a design point
+    apps: [../../app/bcd2bin/magic_k4_N2_8x8/config/config.ivl.yaml]
+    stages: [syn, pack, ioplan, place, route]
+
+Each design point is built in ``<output>/<point>/`` through ``tools/profile_build.py``, or on a running
+``tools/buildserver.py`` with ``--server`` so that builds skip the interpreter start-up and PRGA import. Then, for
+every application, a wizard configuration pointing at the design point's context is generated and the requested
+stages of the generated ``app/Makefile`` are run. Design points are processed concurrently (``-j``).
+
+Everything runs locally. The results table (``results.json`` and ``results.csv``) lists per design point the build
+time, the sizes of the generated RRG and RTL, and per application the status, channel width and critical-path
+delay.
+"""
+
+import argparse
+import csv
+import itertools
+import json
+import os
+import re
+import shutil
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import yaml
+
+from benchutil import TOOLS_DIR, run_measured, path_size, absolutize, format_table, dump_json
+from bench_app import STAGES, parse_vpr_log
+
+
+def expand_grid(grid):
+    """List every combination of the values in ``grid``, in a stable order."""
+    keys = list(grid)
+    return [dict(zip(keys, values)) for values in itertools.product(*(grid[k] for k in keys))]
+
+
+def point_name(params):
+    """A directory-friendly name for a design point, e.g. ``N-2_L1-12_fc_in-0.25``."""
+    return "_".join(re.sub(r"[^\w.\-]", "", "{}-{}".format(k, v)) for k, v in params.items()) or "default"
+
+
+def app_name(config):
+    """Name of the application of a wizard configuration ``examples/app/<app>/<fabric>/config/config.<comp>.yaml``."""
+    return os.path.basename(os.path.dirname(os.path.dirname(os.path.dirname(config))))
+
+
+class DesignPoint(object):
+    """One fabric variant of the exploration.
+
+    Args:
+        spec (:obj:`Mapping`): The loaded specification, with paths already made absolute
+        params (:obj:`Mapping`): Parameters of this design point
+        grid_params (:obj:`Mapping`): The subset of ``params`` that varies across the grid
+        outdir (:obj:`str`): Root output directory
+    """
+
+    __slots__ = ["spec", "params", "grid_params", "directory"]
+
+    def __init__(self, spec, params, grid_params, outdir):
+        self.spec = spec
+        self.params = params
+        self.grid_params = grid_params
+        self.directory = os.path.join(outdir, point_name(grid_params))
+
+    def build(self, server = False, timeout = None):
+        os.makedirs(self.directory, exist_ok = True)
+        cmd = [os.path.join(TOOLS_DIR, "profile_build.py"), "-o", "build.prof.json",
+                "--params", json.dumps(self.params), self.spec["build"], "ctx.pkl"]
+        if server:
+            cmd = [sys.executable, os.path.join(TOOLS_DIR, "buildserver.py"), "submit"] + cmd
+        else:
+            cmd = [sys.executable, "-O"] + cmd
+        r = run_measured(cmd, self.directory, os.path.join(self.directory, "build.log"), timeout = timeout)
+        result = {"status": r["status"], "wall": r["wall"], "peak_rss_kb": None if server else r["peak_rss_kb"]}
+        for key, output in (("rrg_bytes", "vpr/rrg.xml"), ("rtl_bytes", "rtl")):
+            size = path_size(os.path.join(self.directory, output))
+            result[key] = size and size[0]
+        return result
+
+    def implement(self, config, stages, timeout = None, workdir = None, seed = None):
+        """Implement the application described by the wizard configuration ``config`` on this design point.
+
+        Args:
+            config (:obj:`str`): Wizard configuration of the application
+            stages (:obj:`Sequence` [:obj:`str` ]): Targets of the generated ``app/Makefile`` run in order
+            timeout (:obj:`float`): Timeout of each step, in seconds
+            workdir (:obj:`str`): Directory of the generated project (default: ``<point>/<app>``)
+            seed (:obj:`tuple` [:obj:`str`, :obj:`Sequence` [:obj:`str` ]]): A directory and paths relative to it,
+                copied into the generated ``app/`` before the stages run, e.g. outputs of a shared synthesis run.
+                The copies are newer than the generated project, so ``make`` treats them as up to date
+        """
+        app = app_name(config)
+        workdir = workdir or os.path.join(self.directory, app)
+        os.makedirs(workdir, exist_ok = True)
+
+        with open(config) as f:
+            cfg = absolutize(yaml.safe_load(f), os.path.dirname(config))
+        cfg["context"] = os.path.join(self.directory, "ctx.pkl")
+        with open(os.path.join(workdir, "config.yaml"), "w") as f:
+            yaml.safe_dump(cfg, f, default_flow_style = False)
+
+        result = {"app": app, "stages": {}}
+        steps = [("project", [sys.executable, "-O", "-m", "prga.tools.wizard", "config.yaml"], workdir)]
+        steps.extend( (stage, ["make", stage], os.path.join(workdir, "app")) for stage in stages )
+        result["status"] = "ok"
+        for stage, cmd, cwd in steps:
+            log = os.path.join(workdir, stage + ".log")
+            r = run_measured(cmd, cwd, log, timeout = timeout)
+            result["stages"][stage] = r["wall"]
+            if stage == "route":
+                result["channel_width"], result["critical_path"] = parse_vpr_log(log)
+            elif stage == "place" and result.get("critical_path") is None:
+                result["critical_path"] = parse_vpr_log(log)[1]
+            if r["status"] != "ok":
+                result["status"] = "{} failed".format(stage)
+                break
+            if stage == "project" and seed is not None:
+                for path in seed[1]:
+                    dst = os.path.join(cwd, "app", path)
+                    os.makedirs(os.path.dirname(dst), exist_ok = True)
+                    shutil.copyfile(os.path.join(seed[0], path), dst)
+        return result
+
+    def run(self, server = False, skip_apps = False, timeout = None):
+        result = {"name": point_name(self.grid_params), "params": self.params, "apps": {}}
+        result["build"] = self.build(server, timeout)
+        if result["build"]["status"] == "ok" and not skip_apps:
+            for config in self.spec.get("apps", []):
+                r = self.implement(config, self.spec.get("stages", STAGES), timeout)
+                result["apps"][r.pop("app")] = r
+        return result
+
+
+def load_spec(path):
+    with open(path) as f:
+        spec = yaml.safe_load(f)
+    base = os.path.dirname(os.path.abspath(path))
+    spec["build"] = os.path.normpath(os.path.join(base, spec["build"]))
+    spec["apps"] = [os.path.normpath(os.path.join(base, os.path.expandvars(a))) for a in spec.get("apps", [])]
+    return spec
+
+
+def summarize(results):
+    """Flatten the results into rows: one per design point, with one group of columns per application."""
+    rows, apps = [], []
+    for r in results:
+        row = dict(r["params"])
+        row.update({"point": r["name"], "build": r["build"]["status"], "build_wall": r["build"]["wall"],
+            "rrg_mib": r["build"]["rrg_bytes"] and r["build"]["rrg_bytes"] / (1 << 20),
+            "rtl_mib": r["build"]["rtl_bytes"] and r["build"]["rtl_bytes"] / (1 << 20)})
+        for app, a in r["apps"].items():
+            if app not in apps:
+                apps.append(app)
+            row.update({"{}.status".format(app): a["status"], "{}.cw".format(app): a.get("channel_width"),
+                "{}.cpd".format(app): a.get("critical_path"),
+                "{}.wall".format(app): sum(a["stages"].values())})
+        rows.append(row)
+    return rows, apps
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Design-space exploration with parallel fabric sweeps")
+    parser.add_argument("spec", type = str, help = "Exploration specification (YAML)")
+    parser.add_argument("-o", "--output", type = str, default = None,
+            help = "Output directory (default: bench/dse/<name of the spec directory>)")
+    parser.add_argument("-j", "--jobs", type = int, default = os.cpu_count(),
+            help = "Number of design points processed concurrently (default: number of CPUs)")
+    parser.add_argument("--server", action = "store_true",
+            help = "Submit builds to a running tools/buildserver.py instead of starting new interpreters")
+    parser.add_argument("--skip-apps", action = "store_true", help = "Only build the design points")
+    parser.add_argument("--timeout", type = float, default = None, help = "Timeout of each step, in seconds")
+    args = parser.parse_args(argv)
+
+    spec = load_spec(args.spec)
+    outdir = os.path.abspath(args.output or os.path.join(TOOLS_DIR, "..", "bench", "dse",
+        os.path.basename(os.path.dirname(os.path.abspath(args.spec)))))
+    points = []
+    for grid_params in expand_grid(spec.get("grid", {})):
+        params = dict(spec.get("params", {}))
+        params.update(grid_params)
+        points.append(DesignPoint(spec, params, grid_params, outdir))
+    print("{} design points, {} application(s), output in {}".format(len(points), len(spec["apps"]), outdir))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers = max(1, args.jobs)) as pool:
+        results = list(pool.map(lambda p: p.run(args.server, args.skip_apps, args.timeout), points))
+
+    dump_json({"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "spec": os.path.abspath(args.spec),
+        "wall": time.perf_counter() - start, "results": results}, os.path.join(outdir, "results.json"))
+
+    rows, apps = summarize(results)
+    grid_keys = list(spec.get("grid", {}))
+    columns = [("point", "design point", "s"), ("build", "build", "s"), ("build_wall", "build (s)", ".1f"),
+            ("rrg_mib", "rrg.xml (MiB)", ".2f"), ("rtl_mib", "rtl/ (MiB)", ".2f")]
+    for app in apps:
+        columns.extend([("{}.status".format(app), app, "s"), ("{}.cw".format(app), "chan width", "d"),
+            ("{}.cpd".format(app), "CPD (ns)", ".3f"), ("{}.wall".format(app), "impl (s)", ".1f")])
+    print(format_table(rows, columns))
+
+    with open(os.path.join(outdir, "results.csv"), "w", newline = "") as f:
+        fields = grid_keys + [k for k, _, _ in columns]
+        writer = csv.DictWriter(f, fieldnames = fields, extrasaction = "ignore")
+        writer.writeheader()
+        writer.writerows(rows)
+
+    return 0 if all(r["build"]["status"] == "ok" and all(a["status"] == "ok" for a in r["apps"].values())
+            for r in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,338 @@
+# -*- encoding: ascii -*-
+"""Run an FPGA build script and record per-pass wall time, CPU time, peak RSS and outputs.
+
+Usage::
+
+    python -O tools/profile_build.py [-o build.prof.json] [--cprofile] [--tracemalloc] [--params JSON] build.py [args]
+
+The build script is executed in this interpreter as ``__main__``. Every pass executed by ``Flow.run`` is timed,
+and a machine-readable profile is written once the script finishes (or fails). The default instrumentation only
+reads clocks and ``getrusage``, so it is cheap enough to be left on in CI. ``--cprofile`` dumps one ``.pstats``
+file per pass, and ``--tracemalloc`` records the allocation sites that grew the most during each pass.
+
+For each pass, the profile lists the modules it created, the modules it modified (see ``_snapshot_modules``) and the
+files it rendered. Most outputs are only written by ``Flow.run`` after its passes; they are reported on the
+``(flow overhead and rendering)`` entry of each flow.
+
+``--params`` passes a parameter set to the build script as the global dict ``BUILD_PARAMS``. When this script itself
+runs on ``tools/buildserver.py``, the ``BUILD_PARAMS`` and ``WARM_CONTEXT`` it receives are forwarded to the build
+script.
+"""
+
+import argparse
+import cProfile
+import json
+import os
+import resource
+import runpy
+import sys
+import time
+import tracemalloc
+
+from benchutil import snapshot_files
+
+
+def _maxrss_kb():
+    """Peak resident set size of this process in KiB."""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == "darwin" else rss
+
+
+def _cpu_time():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _rendered(before, after, exclude, exclude_dirs = ()):
+    # logs (e.g. ``build.log`` written through ``tee``) grow while the passes run; they are not rendered files
+    return set(path for path, stat in after.items()
+            if path not in exclude and not path.endswith(".log") and before.get(path) != stat
+            and not any(path.startswith(d + os.sep) for d in exclude_dirs))
+
+
+def _snapshot_modules(context):
+    """Map the key of every module in the database of ``context`` to a cheap fingerprint of its contents.
+
+    The fingerprint is the identity of the module object and the sizes of its ports, instances and connection
+    graph, so a module counts as modified when a pass replaces it or adds or removes ports, instances or
+    connections. Changes that keep all these sizes (e.g. only updating properties) are not detected.
+    """
+    database = getattr(context, "database", None)
+    if not hasattr(database, "items"):
+        return {}
+    modules = {}
+    for key, module in database.items():
+        graph = getattr(module, "_conn_graph", None)
+        modules[key] = (id(module), len(getattr(module, "ports", ())), len(getattr(module, "instances", ())),
+                len(graph) if graph is not None else 0,
+                graph.number_of_edges() if hasattr(graph, "number_of_edges") else 0)
+    return modules
+
+
+def _changed_modules(before, after):
+    """Return the (created, modified) module keys between two ``_snapshot_modules`` snapshots."""
+    created = set(key for key in after if key not in before)
+    modified = set(key for key, fp in after.items() if key in before and before[key] != fp)
+    return created, modified
+
+
+# frames of the profiler itself, hidden from the ``--tracemalloc`` reports
+_TRACEMALLOC_FILTERS = (
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, cProfile.__file__),
+        tracemalloc.Filter(False, __file__),
+        tracemalloc.Filter(False, snapshot_files.__code__.co_filename),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+        tracemalloc.Filter(False, "<frozen runpy>"),
+        tracemalloc.Filter(False, runpy.__file__),
+        )
+
+
+class PassProfiler(object):
+    """Instrument ``Flow.run`` and the ``run`` method of every pass class.
+
+    The time the profiler spends on its own bookkeeping (snapshots, ``tracemalloc`` comparisons, ``.pstats`` dumps)
+    is excluded from the passes and from the ``(flow overhead and rendering)`` entry, and reported as a separate
+    ``(profiler overhead)`` entry of each flow.
+
+    Args:
+        root (:obj:`str`): Directory in which rendered files are counted
+        profile_dir (:obj:`str`): If set, dump one cProfile ``.pstats`` file per pass into this directory
+        trace_malloc (:obj:`bool`): If set, record the top allocation sites of each pass with ``tracemalloc``
+        exclude (:obj:`Container` [:obj:`str` ]): Files ignored when counting rendered files
+    """
+
+    __slots__ = ["root", "profile_dir", "trace_malloc", "exclude", "records", "_depth", "_nflows", "_patch_passes",
+            "_touched", "_overhead"]
+
+    def __init__(self, root, profile_dir = None, trace_malloc = False, exclude = tuple()):
+        self.root = root
+        self.profile_dir = profile_dir
+        self.trace_malloc = trace_malloc
+        self.exclude = set(exclude)
+        self.records = []
+        self._depth = 0
+        self._nflows = 0
+        self._touched = None      # (files, created modules, modified modules) of the passes of the running flow
+        self._overhead = None     # [wall, cpu] spent on bookkeeping during the running flow
+
+    def install(self):
+        from prga.passes.base import AbstractPass
+        from prga.passes.flow import Flow
+
+        Flow.run = self._wrap_flow(Flow.run)
+
+        # wrap ``run`` of all pass classes known when a flow starts, so that passes defined in build scripts are
+        # instrumented as well
+        def patch_passes(cls = AbstractPass):
+            for sub in cls.__subclasses__():
+                run = sub.__dict__.get("run")
+                if run is not None and not getattr(run, "_prga_profiled", False):
+                    sub.run = self._wrap_pass(run)
+                patch_passes(sub)
+
+        self._patch_passes = patch_passes
+
+    def _rendered(self, before, after):
+        return _rendered(before, after, self.exclude, (self.profile_dir, ) if self.profile_dir else ())
+
+    def _add_overhead(self, wall, cpu):
+        if self._overhead is not None:
+            self._overhead[0] += time.perf_counter() - wall
+            self._overhead[1] += _cpu_time() - cpu
+
+    def _measure(self, fn, record, context):
+        start_wall, start_cpu = time.perf_counter(), _cpu_time()
+        modules = _snapshot_modules(context)
+        files = snapshot_files(self.root)
+        rss, cpu, wall = _maxrss_kb(), _cpu_time(), time.perf_counter()
+        if self.trace_malloc:
+            malloc_before = tracemalloc.take_snapshot()
+        prof = cProfile.Profile() if self.profile_dir else None
+        self._add_overhead(start_wall, start_cpu)
+        wall, cpu = time.perf_counter(), _cpu_time()
+
+        try:
+            if prof:
+                return prof.runcall(fn)
+            else:
+                return fn()
+
+        finally:
+            end_wall, end_cpu = time.perf_counter(), _cpu_time()
+            record["wall"] = end_wall - wall
+            record["cpu"] = end_cpu - cpu
+            record["peak_rss_kb"] = _maxrss_kb()
+            record["peak_rss_delta_kb"] = record["peak_rss_kb"] - rss
+            created, modified = _changed_modules(modules, _snapshot_modules(context))
+            rendered = self._rendered(files, snapshot_files(self.root))
+            record["modules_created"] = len(created)
+            record["modules_modified"] = len(modified)
+            record["files_rendered"] = len(rendered)
+            if self._touched is not None:
+                for touched, changed in zip(self._touched, (rendered, created, modified)):
+                    touched.update(changed)
+            if self.trace_malloc:
+                stats = tracemalloc.take_snapshot().filter_traces(_TRACEMALLOC_FILTERS).compare_to(
+                        malloc_before.filter_traces(_TRACEMALLOC_FILTERS), "lineno")
+                record["top_allocations"] = [{"site": str(s.traceback), "size_diff": s.size_diff, "count_diff":
+                    s.count_diff} for s in stats[:10]]
+            if prof:
+                os.makedirs(self.profile_dir, exist_ok = True)
+                record["pstats"] = os.path.join(self.profile_dir, "{:02d}_{}.pstats".format(
+                    len(self.records), record["key"].replace("/", "_").replace(".", "_")))
+                prof.dump_stats(record["pstats"])
+            self.records.append(record)
+            self._add_overhead(end_wall, end_cpu)
+
+    def _wrap_flow(self, run):
+        profiler = self
+
+        def wrapped(self, context, *args, **kwargs):
+            profiler._patch_passes()
+            flow, profiler._nflows = profiler._nflows, profiler._nflows + 1
+            npasses = len(profiler.records)
+            touched, profiler._touched = profiler._touched, (set(), set(), set())
+            overhead, profiler._overhead = profiler._overhead, [0., 0.]
+            start_wall, start_cpu = time.perf_counter(), _cpu_time()
+            modules, files = _snapshot_modules(context), snapshot_files(profiler.root)
+            profiler._add_overhead(start_wall, start_cpu)
+            wall, cpu = time.perf_counter(), _cpu_time()
+            try:
+                return run(self, context, *args, **kwargs)
+            finally:
+                end_wall, end_cpu = time.perf_counter(), _cpu_time()
+                flow_overhead = list(profiler._overhead)
+                # whatever ``Flow.run`` spent outside of the passes is mostly rendering: RTL, scripts and other
+                # outputs queued by the passes are written here, so files and modules are counted over the whole
+                # flow, minus what the passes already accounted for
+                passes = profiler.records[npasses:]
+                created, modified = _changed_modules(modules, _snapshot_modules(context))
+                rendered = profiler._rendered(files, snapshot_files(profiler.root))
+                files_by_passes, created_by_passes, modified_by_passes = profiler._touched
+                profiler._touched = touched
+                profiler.records.append({
+                    "flow": flow,
+                    "key": "(flow overhead and rendering)",
+                    "class": type(self).__name__,
+                    "wall": end_wall - wall - sum(r["wall"] for r in passes) - flow_overhead[0],
+                    "cpu": end_cpu - cpu - sum(r["cpu"] for r in passes) - flow_overhead[1],
+                    "peak_rss_kb": _maxrss_kb(),
+                    "modules_created": len(created - created_by_passes),
+                    "modules_modified": len(modified - modified_by_passes - created_by_passes),
+                    "files_rendered": len(rendered - files_by_passes),
+                    })
+                profiler._add_overhead(end_wall, end_cpu)
+                profiler.records.append({
+                    "flow": flow,
+                    "key": "(profiler overhead)",
+                    "class": type(profiler).__name__,
+                    "wall": profiler._overhead[0],
+                    "cpu": profiler._overhead[1],
+                    })
+                # a nested flow runs within a pass of the enclosing flow, which then excludes its overhead as well
+                if overhead is not None:
+                    overhead[0] += profiler._overhead[0]
+                    overhead[1] += profiler._overhead[1]
+                profiler._overhead = overhead
+
+        return wrapped
+
+    def _wrap_pass(self, run):
+        profiler = self
+
+        def wrapped(self, context, *args, **kwargs):
+            # only the outermost ``run`` is recorded when subclasses call ``super().run``
+            if profiler._depth:
+                return run(self, context, *args, **kwargs)
+            profiler._depth += 1
+            try:
+                key = getattr(self, "key", None) or type(self).__name__
+                record = {"flow": profiler._nflows - 1, "key": key, "class": type(self).__name__}
+                return profiler._measure(lambda: run(self, context, *args, **kwargs), record, context)
+            finally:
+                profiler._depth -= 1
+
+        wrapped._prga_profiled = True
+        wrapped.__doc__ = run.__doc__
+        return wrapped
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(
+            description = "Run an FPGA build script and record per-pass profiling information")
+    parser.add_argument("-o", "--output", type = str, default = "build.prof.json",
+            help = "Machine-readable profile (default: build.prof.json)")
+    parser.add_argument("--cprofile", action = "store_true",
+            help = "Dump one cProfile .pstats file per pass next to the profile")
+    parser.add_argument("--tracemalloc", action = "store_true",
+            help = "Record the allocation sites that grew the most during each pass")
+    parser.add_argument("--params", type = json.loads, default = None,
+            help = "JSON object passed to the build script as BUILD_PARAMS")
+    parser.add_argument("script", type = str, help = "The build script, e.g. build.py")
+    parser.add_argument("args", nargs = argparse.REMAINDER, help = "Arguments passed to the build script")
+    args = parser.parse_args(argv)
+
+    output = os.path.abspath(args.output)
+    profile_dir = os.path.splitext(output)[0] + ".pstats.d" if args.cprofile else None
+    profiler = PassProfiler(os.getcwd(), profile_dir, args.tracemalloc, exclude = (output, ))
+
+    if args.tracemalloc:
+        tracemalloc.start()
+
+    wall, cpu = time.perf_counter(), _cpu_time()
+    import prga
+    import_time = time.perf_counter() - wall
+    profiler.install()
+
+    # forward what ``tools/buildserver.py`` injected into this script
+    init_globals = {k: globals()[k] for k in ("BUILD_PARAMS", "WARM_CONTEXT") if k in globals()}
+    if args.params is not None:
+        init_globals["BUILD_PARAMS"] = args.params
+
+    sys.argv = [args.script] + args.args
+    sys.path.insert(0, os.path.dirname(os.path.abspath(args.script)))
+    status = "ok"
+    try:
+        runpy.run_path(args.script, init_globals = init_globals, run_name = "__main__")
+    except SystemExit as e:
+        if e.code not in (None, 0):
+            status = "exit({})".format(e.code)
+            raise
+    except BaseException as e:
+        status = type(e).__name__
+        raise
+    finally:
+        report = {
+                "script": os.path.abspath(args.script),
+                "args": args.args,
+                "params": init_globals.get("BUILD_PARAMS"),
+                "status": status,
+                "python": sys.version.split()[0],
+                "prga": getattr(prga, "VERSION", None),
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "total": {
+                    "wall": time.perf_counter() - wall,
+                    "cpu": _cpu_time() - cpu,
+                    "import": import_time,
+                    "peak_rss_kb": _maxrss_kb(),
+                    },
+                "passes": profiler.records,
+                }
+        with open(output, "w") as f:
+            json.dump(report, f, indent = 4)
+
+        print("[PROFILE] {:<40s} {:>10s} {:>10s} {:>12s} {:>8s} {:>8s} {:>8s}".format(
+            "pass", "wall (s)", "cpu (s)", "dRSS (KiB)", "created", "modified", "files"))
+        for r in profiler.records:
+            print("[PROFILE] {:<40s} {:>10.3f} {:>10.3f} {:>12} {:>8} {:>8} {:>8}".format(
+                r["key"][:40], r["wall"], r["cpu"], r.get("peak_rss_delta_kb", "-"),
+                r.get("modules_created", "-"), r.get("modules_modified", "-"), r.get("files_rendered", "-")))
+        print("[PROFILE] {:<40s} {:>10.3f} {:>10.3f} {:>12} (peak)".format(
+            "total", report["total"]["wall"], report["total"]["cpu"], report["total"]["peak_rss_kb"]))
+        print("[PROFILE] profile written to {}".format(output))
+
+
+if __name__ == "__main__":
+    main()
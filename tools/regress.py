@@ -0,0 +1,274 @@
+# -*- encoding: ascii -*-
+"""Run the behavioral, post-synthesis and post-implementation tests of wizard-generated projects in parallel.
+
+Usage::
+
+    python tools/regress.py [-o bench/regress] [-j JOBS] [--max-mem GIB] [-t behav postsyn postimpl] [PROJECT ...]
+
+A project is a directory in which ``prga.tools.wizard`` generated ``app/`` and ``tests/``, e.g.
+``examples/app/bcd2bin/magic_k4_N2_8x8``. If no project is given, every example under ``examples/app`` with generated
+tests is used. All ``tests/<name>`` directories of the projects are discovered automatically.
+
+The netlists shared by the tests of a project are built once before any test starts: ``make -C app syn`` for
+``postsyn`` and ``make -C app`` (the full RTL-to-bitstream flow) for ``postimpl``. Tests then run concurrently;
+the targets of one test run in order, since they share the test directory. A test is only started when the
+memory reserved for the running tests, estimated per target with ``--mem``, fits in ``--max-mem``.
+
+Results are written as JUnit XML (``<output>/junit.xml``) and JSON (``<output>/results.json``).
+"""
+
+import argparse
+import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from glob import glob
+from xml.sax.saxutils import escape, quoteattr
+
+from benchutil import PRGA_ROOT, run_measured, format_table, dump_json
+
+TARGETS = ("behav", "postsyn", "postimpl")
+
+# default memory reserved for each target, in GiB
+DEFAULT_MEM = {"behav": 0.5, "postsyn": 1., "postimpl": 4.}
+
+
+def mem_available_gib():
+    """Available memory according to ``/proc/meminfo``, or ``None`` if unknown."""
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) / (1 << 20)
+    except OSError:
+        pass
+    return None
+
+
+class MemoryGate(object):
+    """Admit jobs as long as the sum of their reserved memory fits in a budget.
+
+    A job that does not fit in an empty budget is still admitted, alone, so that nothing is starved.
+
+    Args:
+        budget (:obj:`float`): Total memory that may be reserved, in GiB. ``None`` for no limit
+    """
+
+    __slots__ = ["budget", "reserved", "running", "_cond"]
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.reserved = 0.
+        self.running = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, amount):
+        with self._cond:
+            while (self.budget is not None and self.running > 0 and
+                    self.reserved + amount > self.budget):
+                self._cond.wait()
+            self.reserved += amount
+            self.running += 1
+
+    def release(self, amount):
+        with self._cond:
+            self.reserved -= amount
+            self.running -= 1
+            self._cond.notify_all()
+
+
+class Project(object):
+    """A wizard-generated project.
+
+    Args:
+        directory (:obj:`str`): Directory containing ``app/`` and ``tests/``
+    """
+
+    __slots__ = ["directory"]
+
+    def __init__(self, directory):
+        self.directory = os.path.abspath(directory)
+
+    @property
+    def name(self):
+        rel = os.path.relpath(self.directory, os.path.join(PRGA_ROOT, "examples", "app"))
+        return (rel if not rel.startswith("..") else os.path.basename(self.directory)).replace(os.sep, "_")
+
+    @property
+    def tests(self):
+        return sorted(os.path.basename(os.path.dirname(m))
+                for m in glob(os.path.join(self.directory, "tests", "*", "Makefile")))
+
+    def prerequisites(self, targets):
+        """List the (name, make arguments) of the shared builds needed by ``targets``."""
+        if "postimpl" in targets:
+            return [("app", ["-C", "app"])]
+        elif "postsyn" in targets:
+            return [("app.syn", ["-C", "app", "syn"])]
+        return []
+
+
+def run_test(project, test, targets, logdir, gate, mem, fail_pattern, timeout):
+    """Run ``targets`` of one test in order. Returns one result per target."""
+    amount = max(mem[t] for t in targets)
+    gate.acquire(amount)
+    try:
+        results = []
+        for target in targets:
+            log = os.path.join(logdir, "{}.{}.log".format(test, target))
+            r = run_measured(["make", target], os.path.join(project.directory, "tests", test), log,
+                    timeout = timeout)
+            if r["status"] == "ok" and fail_pattern is not None:
+                with open(log, errors = "replace") as f:
+                    if any(fail_pattern.search(line) for line in f):
+                        r["status"] = "fail"
+            results.append({"project": project.name, "test": test, "target": target, "log": log,
+                "status": r["status"], "time": r["wall"], "peak_rss_kb": r["peak_rss_kb"]})
+            if r["status"] != "ok":
+                # later targets depend on the same sources; report them as skipped
+                results.extend({"project": project.name, "test": test, "target": t, "status": "skipped",
+                    "time": 0.} for t in targets[len(results):])
+                break
+        return results
+    finally:
+        gate.release(amount)
+
+
+def tail(path, lines = 50):
+    if path is None or not os.path.isfile(path):
+        return ""
+    with open(path, errors = "replace") as f:
+        return "".join(f.readlines()[-lines:])
+
+
+def write_junit(results, prereqs, path):
+    """Write ``results`` as JUnit XML: one test suite per project, one test case per (test, target)."""
+    suites = {}
+    for r in prereqs + results:
+        suites.setdefault(r["project"], []).append(r)
+
+    lines = ['<?xml version="1.0" encoding="UTF-8"?>', "<testsuites>"]
+    for project, cases in suites.items():
+        lines.append('  <testsuite name={} tests="{}" failures="{}" skipped="{}" time="{:.3f}">'.format(
+            quoteattr(project), len(cases),
+            sum(1 for c in cases if c["status"] in ("fail", "timeout")),
+            sum(1 for c in cases if c["status"] == "skipped"),
+            sum(c["time"] for c in cases)))
+        for c in cases:
+            lines.append('    <testcase classname={} name={} time="{:.3f}">'.format(
+                quoteattr(project), quoteattr("{}.{}".format(c["test"], c["target"])), c["time"]))
+            if c["status"] == "skipped":
+                lines.append("      <skipped/>")
+            elif c["status"] != "ok":
+                lines.append('      <failure message={}>{}</failure>'.format(
+                    quoteattr(c["status"]), escape(tail(c.get("log")))))
+            lines.append("    </testcase>")
+        lines.append("  </testsuite>")
+    lines.append("</testsuites>")
+
+    with open(path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Run the tests of wizard-generated projects in parallel")
+    parser.add_argument("projects", type = str, nargs = "*",
+            help = "Project directories (default: all examples under examples/app with generated tests)")
+    parser.add_argument("-o", "--output", type = str, default = os.path.join(PRGA_ROOT, "bench", "regress"),
+            help = "Directory for the logs and reports (default: bench/regress)")
+    parser.add_argument("-t", "--targets", type = str, nargs = "+", default = list(TARGETS), choices = TARGETS,
+            help = "Targets run for each test, in order (default: all)")
+    parser.add_argument("-k", "--filter", type = str, default = None,
+            help = "Only run tests (<project>.<test>) matching this regular expression")
+    parser.add_argument("-j", "--jobs", type = int, default = os.cpu_count(),
+            help = "Maximum number of tests run concurrently (default: number of CPUs)")
+    parser.add_argument("--max-mem", type = float, default = None,
+            help = "Memory budget for concurrent tests in GiB (default: available memory)")
+    parser.add_argument("--mem", type = str, nargs = "+", default = [],
+            help = "Memory reserved per target in GiB, e.g. postimpl=8 (default: {})".format(
+                " ".join("{}={}".format(k, v) for k, v in DEFAULT_MEM.items())))
+    parser.add_argument("--fail-pattern", type = str, default = None,
+            help = "Regular expression that marks a test as failed when found in its log, even if make succeeded")
+    parser.add_argument("--timeout", type = float, default = None, help = "Timeout of each target, in seconds")
+    args = parser.parse_args(argv)
+
+    mem = dict(DEFAULT_MEM)
+    for spec in args.mem:
+        target, _, amount = spec.partition("=")
+        if target not in mem:
+            parser.error("Unknown target in --mem: {}".format(target))
+        mem[target] = float(amount)
+    fail_pattern = re.compile(args.fail_pattern) if args.fail_pattern else None
+
+    if args.projects:
+        projects = [Project(d) for d in args.projects]
+    else:
+        projects = [Project(os.path.dirname(d)) for d in
+                sorted(glob(os.path.join(PRGA_ROOT, "examples", "app", "*", "*", "tests")))]
+    jobs = [(p, t) for p in projects for t in p.tests
+            if args.filter is None or re.search(args.filter, "{}.{}".format(p.name, t))]
+    projects = [p for p in projects if any(p is q for q, _ in jobs)]
+    if not jobs:
+        print("No test found")
+        return 1
+
+    for p in projects:
+        os.makedirs(os.path.join(args.output, p.name), exist_ok = True)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers = max(1, args.jobs)) as pool:
+        # build the netlists shared by the tests of each project once
+        def build(p):
+            results = []
+            for name, make_args in p.prerequisites(args.targets):
+                log = os.path.join(args.output, p.name, name + ".log")
+                r = run_measured(["make"] + make_args, p.directory, log, timeout = args.timeout)
+                results.append({"project": p.name, "test": "(shared)", "target": name, "log": log,
+                    "status": r["status"], "time": r["wall"], "peak_rss_kb": r["peak_rss_kb"]})
+                if r["status"] != "ok":
+                    break
+            return results
+        prereqs = dict(zip((p.name for p in projects), pool.map(build, projects)))
+
+        gate = MemoryGate(args.max_mem if args.max_mem is not None else mem_available_gib())
+        futures = []
+        for p, t in jobs:
+            if any(r["status"] != "ok" for r in prereqs[p.name]):
+                continue
+            futures.append(pool.submit(run_test, p, t, args.targets, os.path.join(args.output, p.name), gate,
+                mem, fail_pattern, args.timeout))
+        results = [r for f in futures for r in f.result()]
+
+    # tests of projects whose shared netlists failed to build are skipped
+    for p, t in jobs:
+        if any(r["status"] != "ok" for r in prereqs[p.name]):
+            results.extend({"project": p.name, "test": t, "target": target, "status": "skipped", "time": 0.}
+                    for target in args.targets)
+
+    prereqs = [r for rs in prereqs.values() for r in rs]
+    write_junit(results, prereqs, os.path.join(args.output, "junit.xml"))
+    dump_json({
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "wall": time.perf_counter() - start,
+        "jobs": args.jobs,
+        "shared": prereqs,
+        "results": results,
+        }, os.path.join(args.output, "results.json"))
+
+    rows = [{"name": "{}.{}.{}".format(r["project"], r["test"], r["target"]), "status": r["status"],
+        "time": r["time"], "rss": r["peak_rss_kb"] / 1024 if "peak_rss_kb" in r else None}
+        for r in prereqs + results]
+    print(format_table(rows, [("name", "test", "s"), ("status", "status", "s"), ("time", "time (s)", ".1f"),
+        ("rss", "peak RSS (MiB)", ".0f")]))
+
+    failed = [r for r in prereqs + results if r["status"] not in ("ok", "skipped")]
+    print("\n{} passed, {} failed, {} skipped in {:.1f}s".format(
+        sum(1 for r in results if r["status"] == "ok"), len(failed),
+        sum(1 for r in results if r["status"] == "skipped"), time.perf_counter() - start))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())